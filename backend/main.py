@@ -1,17 +1,20 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import pdfplumber
 from pdf2image import convert_from_bytes
 import base64
 import io
-from typing import List, Optional, Dict, Union
+from typing import AsyncIterator, List, Optional, Dict, Union
 import re
 import httpx
 import os
 from dotenv import load_dotenv
 import fitz
 import json
+import asyncio
+from collections import OrderedDict
 
 # Load environment variables
 load_dotenv()
@@ -32,6 +35,58 @@ app.add_middleware(
 answer_keys_storage: Dict[str, Dict[str, str]] = {}
 # Store points per question
 exam_points_storage: Dict[str, Dict[int, int]] = {}
+# Precomputed tutoring hints keyed by PDF content hash, so identical uploads share them:
+# {pdf_hash: {question_id: {"question_text": ..., "explanation": ..., "hint": ..., "model": ...}}}
+tutoring_hints_storage: Dict[str, Dict[int, Dict[str, str]]] = {}
+# Progress and token cost of hint precomputation, keyed by a hash of the PDF content
+hint_precompute_status: Dict[str, Dict[str, Union[str, int, float]]] = {}
+# PDF content hash of each uploaded exam
+exam_content_hashes: Dict[str, str] = {}
+# Question illustrations per exam, attached to tutoring prompts only when needed
+question_images_storage: Dict[str, Dict[int, str]] = {}
+# Tutoring conversations keyed by "exam_id:question_id:student_id", least recently used first
+tutoring_sessions_storage: "OrderedDict[str, TutoringSession]" = OrderedDict()
+
+# Hint precomputation settings
+PRECOMPUTE_HINTS = os.getenv("PRECOMPUTE_HINTS", "false").lower() == "true"
+HINT_PRECOMPUTE_MODEL = os.getenv("HINT_PRECOMPUTE_MODEL", "openai").lower().strip()
+HINT_PRECOMPUTE_CONCURRENCY = int(os.getenv("HINT_PRECOMPUTE_CONCURRENCY", "2"))
+# Max seconds a precompute request waits for live tutoring requests before going ahead anyway
+HINT_PRECOMPUTE_MAX_WAIT = float(os.getenv("HINT_PRECOMPUTE_MAX_WAIT", "10"))
+
+# Approximate USD price per 1K tokens (prompt, completion) for cost reporting
+MODEL_PRICING_PER_1K = {
+    "openai": (0.03, 0.06),      # gpt-4
+    "anthropic": (0.003, 0.015),  # claude-sonnet-4-5
+}
+
+if HINT_PRECOMPUTE_MODEL not in MODEL_PRICING_PER_1K:
+    raise ValueError(
+        f"Invalid HINT_PRECOMPUTE_MODEL: '{HINT_PRECOMPUTE_MODEL}'. Must be 'openai' or 'anthropic'")
+
+# Prompts that can be answered from the precomputed hints
+DEFAULT_EXPLAIN_PROMPTS = {
+    "explain", "explain this", "explain this question", "explain the question",
+    "help", "help me", "what does this mean", "how do i solve this",
+}
+DEFAULT_HINT_PROMPTS = {
+    "hint", "give me a hint", "a hint", "can i have a hint", "i need a hint",
+}
+
+# Number of live tutoring requests in flight; precomputation yields to these
+active_ai_requests = 0
+
+# Max estimated tokens of conversation history (summary + recent turns) sent per tutoring request
+TUTOR_CONTEXT_TOKEN_BUDGET = int(os.getenv("TUTOR_CONTEXT_TOKEN_BUDGET", "1500"))
+# Max tutoring sessions kept in memory; the least recently used are evicted beyond this
+TUTOR_MAX_SESSIONS = int(os.getenv("TUTOR_MAX_SESSIONS", "1000"))
+
+# Student questions that explicitly refer to the question's illustration
+IMAGE_REFERENCE_PATTERN = re.compile(
+    r'\b(diagram|figure|picture|image|graph|chart|illustration|drawing)s?\b', re.IGNORECASE)
+
+# Image formats accepted by both the OpenAI and Anthropic APIs (and browsers)
+SUPPORTED_IMAGE_TYPES = {"png", "jpeg", "gif", "webp"}
 
 # Models
 
@@ -59,6 +114,14 @@ class AIRequest(BaseModel):
     user_question: str
     model: str  # 'openai' or 'anthropic'
     question_context: Optional[str] = None
+    exam_id: Optional[str] = None  # To look up precomputed hints and the tutoring session
+    question_id: Optional[int] = None
+    student_id: Optional[str] = None  # Keeps sessions of different students apart
+
+
+class TutoringSession(BaseModel):
+    summary: str = ""  # Condensed form of turns dropped from the context window
+    turns: List[Dict[str, str]] = []  # Recent {"role": ..., "content": ...} messages
 
 
 class AnswerSubmission(BaseModel):
@@ -183,45 +246,8 @@ def extract_images_with_pymupdf(pdf_bytes: bytes) -> dict:
     return page_images
 
 
-async def parse_exam_paper_with_ai(pdf_bytes: bytes) -> ExamPaper:
-    """Parse PDF exam paper using AI vision to extract structured content"""
-    api_key = os.getenv("OPENAI_API_KEY")
-
-    # Extract full page images for AI analysis
-    full_page_images = extract_images_from_pdf(pdf_bytes)
-
-    # Extract individual illustrations from PDF using PyMuPDF only
-    print("Extracting images with PyMuPDF...")
-    question_images = extract_images_with_pymupdf(pdf_bytes)
-
-    print(f"Extracted {len(full_page_images)} full pages and {sum(len(imgs) for imgs in question_images.values())} individual images from PDF.")
-
-    if not api_key:
-        raise Exception("OpenAI API key not configured")
-    
-    #only first 8 pages for testing
-    full_page_images = full_page_images[:8]
-
-    # Use all pages for analysis
-    image_data = []
-    for idx, img_data in enumerate(full_page_images):
-        # Remove the data:image/png;base64, prefix
-        base64_img = img_data.split(',')[1] if ',' in img_data else img_data
-        
-        # Use "low" detail for faster processing
-        # Only use "high" for first few pages where questions usually are
-        detail_level = "high" if idx < 5 else "low"
-        
-        image_data.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/png;base64,{base64_img}",
-                "detail": detail_level
-            }
-        })
-
-        # Construct prompt for GPT-4 Vision
-    prompt = """Analyze this exam paper PDF and extract all questions WITH THEIR ANSWERS in a structured format.
+# Prompt for GPT-4 Vision exam parsing
+EXAM_PARSE_PROMPT = """Analyze this exam paper PDF and extract all questions WITH THEIR ANSWERS in a structured format.
 
 FIRST, look for any mark allocation instructions (e.g., "Question 1 to 10 carry 2 marks each", "Each question carries X marks").
 
@@ -346,6 +372,231 @@ Important:
 - Ignore watermarks like "www.sgexam.com"
 - If no explicit point values or allocation instructions are shown, omit the points field"""
 
+
+def prepare_exam_pages(pdf_bytes: bytes) -> tuple:
+    """Extract page images and illustrations, and build the image content for the vision model"""
+    # Extract full page images for AI analysis
+    full_page_images = extract_images_from_pdf(pdf_bytes)
+
+    # Extract individual illustrations from PDF using PyMuPDF only
+    print("Extracting images with PyMuPDF...")
+    question_images = extract_images_with_pymupdf(pdf_bytes)
+
+    print(f"Extracted {len(full_page_images)} full pages and {sum(len(imgs) for imgs in question_images.values())} individual images from PDF.")
+
+    #only first 8 pages for testing
+    full_page_images = full_page_images[:8]
+
+    # Use all pages for analysis
+    image_data = []
+    for idx, img_data in enumerate(full_page_images):
+        # Remove the data:image/png;base64, prefix
+        base64_img = img_data.split(',')[1] if ',' in img_data else img_data
+        
+        # Use "low" detail for faster processing
+        # Only use "high" for first few pages where questions usually are
+        detail_level = "high" if idx < 5 else "low"
+        
+        image_data.append({
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:image/png;base64,{base64_img}",
+                "detail": detail_level
+            }
+        })
+
+    return full_page_images, question_images, image_data
+
+
+def convert_to_supported_image(image: str) -> Optional[str]:
+    """
+    Convert an extracted illustration (e.g. jpx, jb2, tiff, bmp) to a PNG data URL
+    if its format is not supported by the AI APIs. Returns None if it cannot be converted.
+    """
+    header, image_data = image.split(',', 1)
+    image_type = header[len("data:image/"):].split(';')[0].lower()
+    if image_type in SUPPORTED_IMAGE_TYPES:
+        return image
+
+    try:
+        from PIL import Image
+        pil_image = Image.open(io.BytesIO(base64.b64decode(image_data)))
+        buffered = io.BytesIO()
+        pil_image.convert("RGBA" if "A" in pil_image.mode else "RGB").save(
+            buffered, format="PNG")
+        print(f"Converted {image_type} illustration to PNG")
+        return f"data:image/png;base64,{base64.b64encode(buffered.getvalue()).decode()}"
+    except Exception as e:
+        print(f"Error converting {image_type} illustration to PNG: {e}")
+        return None
+
+
+def build_question(q: dict, question_counter: int, question_images: dict, full_page_images: List[str]) -> Question:
+    """Convert a parsed question to a Question model, resolving its illustration"""
+    # Check if question needs an illustration
+    question_image = None
+    if q.get("has_illustration", False):
+        page_num = q.get("page", 1)
+        illustration_index = q.get("illustration_index", 0)
+
+        # Try to get the specific illustration from that page
+        if page_num in question_images and len(question_images[page_num]) > illustration_index:
+            question_image = question_images[page_num][illustration_index]
+            print(
+                f"Question {question_counter} has illustration {illustration_index} on page {page_num}")
+        elif page_num in question_images and question_images[page_num]:
+            # Fallback to first image on page if index not found
+            question_image = question_images[page_num][0]
+            print(
+                f"Question {question_counter} using first illustration on page {page_num}")
+        else:
+            # Fallback to full page if no extracted images
+            page_idx = page_num - 1
+            if 0 <= page_idx < len(full_page_images):
+                question_image = full_page_images[page_idx]
+                print(
+                    f"Question {question_counter} using full page {page_num} (no extracted images)")
+
+        # Unsupported illustration formats are converted, falling back to the full page PNG
+        if question_image:
+            question_image = convert_to_supported_image(question_image)
+            page_idx = page_num - 1
+            if question_image is None and 0 <= page_idx < len(full_page_images):
+                question_image = full_page_images[page_idx]
+
+    return Question(
+        id=question_counter,
+        text=q.get("text", ""),
+        type=q.get("type", "short_answer"),
+        options=q.get("options"),
+        points=q.get("points"),
+        image=question_image
+    )
+
+
+def register_question_answer(answer_key: Dict[str, str], question_counter: int, answer) -> None:
+    """Normalize a parsed answer and add it to the answer key"""
+    if answer is None:
+        return
+
+    if isinstance(answer, dict):
+        # Subsection answers (e.g., {"a)": "74950", "b)": "74900"})
+        for subsection_key, subsection_answer in answer.items():
+            full_key = f"{question_counter}-{subsection_key}"
+            processed_answer = extract_final_answer(
+                str(subsection_answer))
+            answer_key[full_key] = processed_answer
+            print(f"Answer for {full_key}: {processed_answer}")
+    else:
+        # Single answer
+        processed_answer = extract_final_answer(str(answer))
+        answer_key[str(question_counter)] = processed_answer
+        print(
+            f"Answer for question {question_counter}: {processed_answer}")
+
+
+def content_hash(pdf_bytes: bytes) -> str:
+    """Stable hash of the PDF used to share precomputed hints between identical uploads"""
+    import hashlib
+    return hashlib.sha256(pdf_bytes).hexdigest()[:16]
+
+
+def discard_exam_storage(exam_id: str) -> None:
+    """Remove the answer key, points and illustrations stored for an exam"""
+    answer_keys_storage.pop(exam_id, None)
+    exam_points_storage.pop(exam_id, None)
+    question_images_storage.pop(exam_id, None)
+
+
+def generate_exam_id() -> str:
+    """Generate unique exam ID"""
+    import hashlib
+    import time
+    return hashlib.md5(f"{time.time()}".encode()).hexdigest()[:12]
+
+
+class IncrementalQuestionParser:
+    """
+    Incrementally parse the streamed exam JSON document.
+    Feed text chunks as they arrive; each call returns the question objects
+    in the "questions" array that have been completed so far.
+    The title is picked up as soon as its string value is complete.
+    """
+
+    TITLE_PATTERN = re.compile(r'"title"\s*:\s*("(?:[^"\\]|\\.)*")')
+    QUESTIONS_PATTERN = re.compile(r'"questions"\s*:\s*\[')
+
+    def __init__(self):
+        self.buffer = ""
+        self.title: Optional[str] = None
+        self.in_array = False
+        self.done = False
+        self.pos = 0  # Next character to scan
+        self.depth = 0  # Brace depth inside the questions array
+        self.in_string = False
+        self.escape = False
+        self.object_start = -1
+
+    def feed(self, chunk: str) -> List[dict]:
+        self.buffer += chunk
+        completed = []
+
+        if self.title is None:
+            match = self.TITLE_PATTERN.search(self.buffer)
+            if match:
+                self.title = json.loads(match.group(1))
+
+        if not self.in_array:
+            match = self.QUESTIONS_PATTERN.search(self.buffer)
+            if not match:
+                return completed
+            self.in_array = True
+            self.pos = match.end()
+
+        while not self.done and self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                if self.depth == 0:
+                    self.object_start = self.pos
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        completed.append(json.loads(
+                            self.buffer[self.object_start:self.pos + 1]))
+                    except json.JSONDecodeError as e:
+                        print(f"Skipping malformed streamed question: {e}")
+            elif char == ']' and self.depth == 0:
+                self.done = True
+
+            self.pos += 1
+
+        return completed
+
+
+async def parse_exam_paper_with_ai(pdf_bytes: bytes) -> ExamPaper:
+    """Parse PDF exam paper using AI vision to extract structured content"""
+    api_key = os.getenv("OPENAI_API_KEY")
+
+    full_page_images, question_images, image_data = prepare_exam_pages(
+        pdf_bytes)
+
+    if not api_key:
+        raise Exception("OpenAI API key not configured")
+
+    prompt = EXAM_PARSE_PROMPT
+
     try:
         max_retries = 3
         retry_delay = 5  # seconds
@@ -413,69 +664,25 @@ Important:
         question_counter = 1
 
         for q in exam_data.get("questions", []):
-            # Check if question needs an illustration
-            question_image = None
-            if q.get("has_illustration", False):
-                page_num = q.get("page", 1)
-                illustration_index = q.get("illustration_index", 0)
-
-                # Try to get the specific illustration from that page
-                if page_num in question_images and len(question_images[page_num]) > illustration_index:
-                    question_image = question_images[page_num][illustration_index]
-                    print(
-                        f"Question {question_counter} has illustration {illustration_index} on page {page_num}")
-                elif page_num in question_images and question_images[page_num]:
-                    # Fallback to first image on page if index not found
-                    question_image = question_images[page_num][0]
-                    print(
-                        f"Question {question_counter} using first illustration on page {page_num}")
-                else:
-                    # Fallback to full page if no extracted images
-                    page_idx = page_num - 1
-                    if 0 <= page_idx < len(full_page_images):
-                        question_image = full_page_images[page_idx]
-                        print(
-                            f"Question {question_counter} using full page {page_num} (no extracted images)")
-
-            questions.append(Question(
-                id=question_counter,
-                text=q.get("text", ""),
-                type=q.get("type", "short_answer"),
-                options=q.get("options"),
-                points=q.get("points"),
-                image=question_image
-            ))
+            questions.append(build_question(
+                q, question_counter, question_images, full_page_images))
 
             # Extract and process answers
-            answer = q.get("answer")
-            if answer is not None:
-                if isinstance(answer, dict):
-                    # Subsection answers (e.g., {"a)": "74950", "b)": "74900"})
-                    for subsection_key, subsection_answer in answer.items():
-                        full_key = f"{question_counter}-{subsection_key}"
-                        processed_answer = extract_final_answer(
-                            str(subsection_answer))
-                        answer_key[full_key] = processed_answer
-                        print(f"Answer for {full_key}: {processed_answer}")
-                else:
-                    # Single answer
-                    processed_answer = extract_final_answer(str(answer))
-                    answer_key[str(question_counter)] = processed_answer
-                    print(
-                        f"Answer for question {question_counter}: {processed_answer}")
+            register_question_answer(
+                answer_key, question_counter, q.get("answer"))
 
             question_counter += 1
 
         total_points = sum(q.points or 0 for q in questions)
 
         # Generate unique exam ID
-        import hashlib
-        import time
-        exam_id = hashlib.md5(f"{time.time()}".encode()).hexdigest()[:12]
+        exam_id = generate_exam_id()
 
         # Store answer key and points in global storage
         answer_keys_storage[exam_id] = answer_key
         exam_points_storage[exam_id] = {q.id: q.points or 0 for q in questions}
+        question_images_storage[exam_id] = {
+            q.id: q.image for q in questions if q.image}
 
         print(f"Final answer key: {answer_key}")
 
@@ -492,12 +699,238 @@ Important:
         print(f"Error parsing with AI: {e}")
 
 
-async def query_openai(question: str, context: str) -> str:
-    """Query OpenAI API"""
+async def stream_exam_paper_with_ai(pdf_bytes: bytes) -> AsyncIterator[dict]:
+    """
+    Parse PDF exam paper with streamed AI output, yielding events as questions complete:
+    "start" (exam_id and page images), "title", one "question" per question,
+    then "done" (totals and answer key) or "error".
+    Answers are registered as each question arrives, so submissions work immediately.
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+
+    full_page_images, question_images, image_data = prepare_exam_pages(
+        pdf_bytes)
+
+    if not api_key:
+        yield {"type": "error", "message": "OpenAI API key not configured"}
+        return
+
+    exam_id = generate_exam_id()
+    answer_key: Dict[str, str] = {}
+    answer_keys_storage[exam_id] = answer_key
+    exam_points_storage[exam_id] = {}
+    question_images_storage[exam_id] = {}
+    questions: List[Question] = []
+
+    yield {"type": "start", "exam_id": exam_id, "images": full_page_images}
+
+    # Stored entries are only kept if the parse completes (not on errors or client disconnects)
+    succeeded = False
+    try:
+        max_retries = 3
+        retry_delay = 5  # seconds
+        parser = IncrementalQuestionParser()
+        title_sent = False
+        finish_reason = None
+
+        for attempt in range(max_retries):
+            # A retry can only restart cleanly before any question was emitted
+            parser = IncrementalQuestionParser()
+            try:
+                async with httpx.AsyncClient(timeout=90.0) as client:
+                    async with client.stream(
+                        "POST",
+                        "https://api.openai.com/v1/chat/completions",
+                        headers={
+                            "Authorization": f"Bearer {api_key}",
+                            "Content-Type": "application/json"
+                        },
+                        json={
+                            "model": "gpt-4o",
+                            "messages": [
+                                {
+                                    "role": "user",
+                                    "content": [
+                                        {"type": "text", "text": EXAM_PARSE_PROMPT},
+                                        *image_data
+                                    ]
+                                }
+                            ],
+                            "max_tokens": 4096,
+                            "response_format": {"type": "json_object"},
+                            "stream": True
+                        }
+                    ) as response:
+                        if response.status_code in (502, 503) and attempt < max_retries - 1:
+                            print(
+                                f"OpenAI API returned {response.status_code}, retrying in {retry_delay} seconds... (attempt {attempt + 1}/{max_retries})")
+                            await asyncio.sleep(retry_delay)
+                            continue
+
+                        if response.status_code != 200:
+                            error_body = await response.aread()
+                            print(
+                                f"OpenAI API error: {response.status_code} - {error_body.decode(errors='replace')}")
+                            yield {"type": "error", "message": f"OpenAI API error: {response.status_code}"}
+                            return
+
+                        async for line in response.aiter_lines():
+                            # Server-sent events: "data: {...}" lines, terminated by "data: [DONE]"
+                            if not line.startswith("data: "):
+                                continue
+                            data = line[len("data: "):]
+                            if data == "[DONE]":
+                                break
+
+                            choices = json.loads(data).get("choices") or []
+                            if choices and choices[0].get("finish_reason"):
+                                finish_reason = choices[0]["finish_reason"]
+                            content = choices[0].get("delta", {}).get(
+                                "content") if choices else None
+                            if not content:
+                                continue
+
+                            for q in parser.feed(content):
+                                question = build_question(
+                                    q, len(questions) + 1, question_images, full_page_images)
+                                questions.append(question)
+                                register_question_answer(
+                                    answer_key, question.id, q.get("answer"))
+                                exam_points_storage[exam_id][question.id] = question.points or 0
+                                if question.image:
+                                    question_images_storage[exam_id][question.id] = question.image
+                                yield {"type": "question", "question": question.model_dump()}
+
+                            if parser.title is not None and not title_sent:
+                                title_sent = True
+                                yield {"type": "title", "title": parser.title}
+                break  # Success, exit retry loop
+
+            except httpx.TimeoutException:
+                if attempt < max_retries - 1 and not questions:
+                    print(
+                        f"Request timeout, retrying... (attempt {attempt + 1}/{max_retries})")
+                    await asyncio.sleep(retry_delay)
+                    continue
+                yield {"type": "error", "message": "Request to OpenAI timed out"}
+                return
+            except (httpx.HTTPError, ValueError) as e:
+                # Connection drops mid-stream or malformed SSE/JSON data; the client still needs a final event
+                print(f"Error streaming exam parse: {e}")
+                yield {"type": "error", "message": f"Error parsing with AI: {str(e)}"}
+                return
+
+        # A document cut off at max_tokens never closes the questions array
+        if not parser.in_array:
+            print("Streamed exam parse contained no questions array")
+            yield {"type": "error", "message": "Error parsing with AI: no questions found in the response"}
+            return
+        if not parser.done or finish_reason == "length":
+            print(
+                f"Streamed exam parse incomplete after {len(questions)} question(s) (finish_reason: {finish_reason})")
+            yield {"type": "error", "message": "Error parsing with AI: the response was cut off before all questions were extracted"}
+            return
+
+        print(f"Final answer key: {answer_key}")
+
+        succeeded = True
+        yield {
+            "type": "done",
+            "exam_id": exam_id,
+            "title": parser.title or "Exam Paper",
+            "total_points": sum(q.points or 0 for q in questions),
+            "answer_key": answer_key
+        }
+    finally:
+        if not succeeded:
+            discard_exam_storage(exam_id)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def get_tutoring_session(request: AIRequest) -> Optional[TutoringSession]:
+    """Get or create the tutoring session for this exam/question/student"""
+    if not request.exam_id or request.question_id is None:
+        return None
+
+    session_key = f"{request.exam_id}:{request.question_id}:{request.student_id or 'anonymous'}"
+    session = tutoring_sessions_storage.get(session_key)
+    if session is None:
+        session = TutoringSession()
+        tutoring_sessions_storage[session_key] = session
+        while len(tutoring_sessions_storage) > TUTOR_MAX_SESSIONS:
+            tutoring_sessions_storage.popitem(last=False)
+    else:
+        tutoring_sessions_storage.move_to_end(session_key)
+    return session
+
+
+def session_context_tokens(session: TutoringSession) -> int:
+    """Estimated tokens of history sent with each request"""
+    return estimate_tokens(session.summary) + sum(estimate_tokens(turn["content"]) for turn in session.turns)
+
+
+def record_session_turn(session: TutoringSession, user_question: str, response: str, image_attached: bool = False):
+    """Add a question/answer pair to the session, keeping history within the token budget"""
+    # Images are sent by reference only in the turn that needs them, never replayed from history
+    if image_attached:
+        user_question = f"{user_question}\n[The question's illustration was attached]"
+    session.turns.append({"role": "user", "content": user_question})
+    session.turns.append({"role": "assistant", "content": response})
+
+    # Fold the oldest turns into the summary until the history fits, always keeping the latest pair
+    while len(session.turns) > 2 and session_context_tokens(session) > TUTOR_CONTEXT_TOKEN_BUDGET:
+        old_question = session.turns.pop(0)["content"]
+        old_answer = session.turns.pop(0)["content"]
+        session.summary += f"\n- Student asked: {old_question[:200]} Tutor answered: {old_answer[:300]}"
+
+    # The summary itself may use at most a quarter of the budget (~4 characters per token)
+    max_summary_chars = TUTOR_CONTEXT_TOKEN_BUDGET
+    if len(session.summary) > max_summary_chars:
+        session.summary = "..." + session.summary[-max_summary_chars:]
+
+
+def build_session_system_prompt(system_prompt: str, context: str, session: TutoringSession) -> str:
+    """System prompt carrying the exam question and the summary of earlier turns"""
+    prompt = f"{system_prompt}\n\nThe student is working on this exam question:\n\n{context}"
+    if session.summary:
+        prompt += f"\n\nSummary of the earlier conversation:{session.summary}"
+    return prompt
+
+
+async def query_openai(question: str, context: str, usage: Optional[Dict[str, int]] = None,
+                       session: Optional[TutoringSession] = None, image: Optional[str] = None) -> str:
+    """
+    Query OpenAI API. If a usage dict is given, it is filled with token counts on success.
+    With a session, the conversation history is sent along; an image switches to the vision model.
+    """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         return "OpenAI API key not configured"
 
+    system_prompt = "You are a helpful tutor explaining exam questions to students."
+    if session is None:
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Question: {context}\n\nStudent asks: {question}"}
+        ]
+    else:
+        user_content = question
+        if image:
+            user_content = [
+                {"type": "text", "text": question},
+                {"type": "image_url", "image_url": {"url": image}}
+            ]
+        messages = [
+            {"role": "system", "content": build_session_system_prompt(
+                system_prompt, context, session)},
+            *session.turns,
+            {"role": "user", "content": user_content}
+        ]
+
     try:
         async with httpx.AsyncClient() as client:
             response = await client.post(
@@ -507,27 +940,60 @@ async def query_openai(question: str, context: str) -> str:
                     "Content-Type": "application/json"
                 },
                 json={
-                    "model": "gpt-4",
-                    "messages": [
-                        {"role": "system", "content": "You are a helpful tutor explaining exam questions to students."},
-                        {"role": "user", "content": f"Question: {context}\n\nStudent asks: {question}"}
-                    ],
+                    "model": "gpt-4o" if image else "gpt-4",
+                    "messages": messages,
                     "max_tokens": 500
                 },
                 timeout=30.0
             )
             response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
+            result = response.json()
+            if usage is not None:
+                usage["prompt_tokens"] = result.get("usage", {}).get("prompt_tokens", 0)
+                usage["completion_tokens"] = result.get("usage", {}).get("completion_tokens", 0)
+            return result["choices"][0]["message"]["content"]
     except Exception as e:
         return f"Error querying OpenAI: {str(e)}"
 
 
-async def query_anthropic(question: str, context: str) -> str:
-    """Query Anthropic Claude API"""
+async def query_anthropic(question: str, context: str, usage: Optional[Dict[str, int]] = None,
+                          session: Optional[TutoringSession] = None, image: Optional[str] = None) -> str:
+    """
+    Query Anthropic Claude API. If a usage dict is given, it is filled with token counts on success.
+    With a session, the conversation history is sent along, plus the image if given.
+    """
     api_key = os.getenv("ANTHROPIC_API_KEY")
     if not api_key or api_key.strip() == "":
         return "Anthropic API key not configured. Please add ANTHROPIC_API_KEY to your .env file."
 
+    request_body = {
+        "model": "claude-sonnet-4-5",
+        "max_tokens": 1024,
+        "messages": [
+            {
+                "role": "user",
+                "content": f"You are a helpful tutor. A student has this exam question:\n\n{context}\n\nThe student asks: {question}\n\nProvide a clear, helpful explanation."
+            }
+        ]
+    }
+    if session is not None:
+        user_content = question
+        if image:
+            # Data URL: "data:image/png;base64,...."
+            header, image_data = image.split(',', 1)
+            media_type = header[len("data:"):].split(';')[0]
+            user_content = [
+                {"type": "image", "source": {
+                    "type": "base64", "media_type": media_type, "data": image_data}},
+                {"type": "text", "text": question}
+            ]
+        request_body["system"] = build_session_system_prompt(
+            "You are a helpful tutor. Provide clear, helpful explanations.", context, session)
+        request_body["messages"] = [
+            *session.turns,
+            {"role": "user", "content": user_content}
+        ]
+
     print(f"Using Anthropic API key: {api_key[:10]}...{api_key[-4:]}")
 
     try:
@@ -539,16 +1005,7 @@ async def query_anthropic(question: str, context: str) -> str:
                     "anthropic-version": "2023-06-01",
                     "content-type": "application/json"
                 },
-                json={
-                    "model": "claude-sonnet-4-5",
-                    "max_tokens": 1024,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": f"You are a helpful tutor. A student has this exam question:\n\n{context}\n\nThe student asks: {question}\n\nProvide a clear, helpful explanation."
-                        }
-                    ]
-                },
+                json=request_body,
                 timeout=30.0
             )
 
@@ -559,17 +1016,157 @@ async def query_anthropic(question: str, context: str) -> str:
 
             response.raise_for_status()
             result = response.json()
+            if usage is not None:
+                usage["prompt_tokens"] = result.get("usage", {}).get("input_tokens", 0)
+                usage["completion_tokens"] = result.get("usage", {}).get("output_tokens", 0)
             return result["content"][0]["text"]
     except httpx.HTTPStatusError as e:
         return f"Error querying Anthropic (HTTP {e.response.status_code}): {e.response.text}"
     except Exception as e:
         return f"Error querying Anthropic: {str(e)}"
 
+
+async def precompute_question_hint(pdf_hash: str, question: Question, semaphore: asyncio.Semaphore):
+    """Precompute a short explanation and worked hint for one question"""
+    status = hint_precompute_status[pdf_hash]
+    exam_hints = tutoring_hints_storage.setdefault(pdf_hash, {})
+    instruction = (
+        "Before the student asks anything, prepare tutoring material for this question. "
+        "Reply ONLY with a JSON object with two keys: "
+        "\"explanation\" (a short explanation of what the question is asking and the concept involved) and "
+        "\"hint\" (a worked hint that shows the first step without giving away the final answer)."
+    )
+
+    # Options are part of the context so the hint can refer to them
+    context = question.text
+    if question.options:
+        context += "\n\nOptions:\n" + "\n".join(question.options)
+
+    async with semaphore:
+        # An earlier upload of the same PDF may already have produced this hint
+        if question.id in exam_hints:
+            status["completed"] += 1
+            return
+
+        # Low priority: wait while students have live tutoring requests in flight,
+        # but not indefinitely so steady traffic can't starve precomputation
+        waited = 0.0
+        while active_ai_requests > 0 and waited < HINT_PRECOMPUTE_MAX_WAIT:
+            await asyncio.sleep(0.5)
+            waited += 0.5
+
+        usage: Dict[str, int] = {}
+        if HINT_PRECOMPUTE_MODEL == "anthropic":
+            response = await query_anthropic(instruction, context, usage)
+        else:
+            response = await query_openai(instruction, context, usage)
+
+    if not usage:
+        # The query helpers return error text instead of raising
+        status["failed"] += 1
+        print(f"Hint precomputation failed for exam {pdf_hash} question {question.id}: {response}")
+        return
+
+    try:
+        # Strip markdown code fences if the model added them
+        hint_data = json.loads(re.sub(r'^```(?:json)?\s*|\s*```$', '', response.strip()))
+        explanation = str(hint_data.get("explanation", "")).strip()
+        hint = str(hint_data.get("hint", "")).strip()
+    except (json.JSONDecodeError, AttributeError):
+        explanation = response.strip()
+        hint = ""
+
+    exam_hints[question.id] = {
+        "question_text": question.text,
+        "explanation": explanation,
+        "hint": hint or explanation,
+        "model": HINT_PRECOMPUTE_MODEL,
+    }
+
+    prompt_price, completion_price = MODEL_PRICING_PER_1K[HINT_PRECOMPUTE_MODEL]
+    status["completed"] += 1
+    status["prompt_tokens"] += usage["prompt_tokens"]
+    status["completion_tokens"] += usage["completion_tokens"]
+    status["estimated_cost_usd"] = round(
+        status["prompt_tokens"] / 1000 * prompt_price
+        + status["completion_tokens"] / 1000 * completion_price, 4)
+    print(
+        f"Precomputed hint for exam {pdf_hash} question {question.id} ({status['completed']}/{status['total']})")
+
+
+def schedule_hint_precompute(background_tasks: BackgroundTasks, exam_id: str, pdf_hash: str, questions: List[Question]):
+    """Queue hint precomputation unless the same PDF already has (or is computing) hints"""
+    exam_content_hashes[exam_id] = pdf_hash
+
+    status = hint_precompute_status.get(pdf_hash)
+    if status is not None and (status["state"] != "done" or status["completed"] > 0):
+        print(f"Hint precomputation for exam {pdf_hash} already {status['state']}, skipping")
+        return
+
+    # Illustrated questions can't be explained from the text alone, and empty ones not at all
+    eligible_questions = [q for q in questions if q.text.strip() and not q.image]
+
+    # Registered before the task runs so concurrent uploads of the same PDF see it
+    hint_precompute_status[pdf_hash] = {
+        "state": "queued",
+        "model": HINT_PRECOMPUTE_MODEL,
+        "total": len(eligible_questions),
+        "skipped": len(questions) - len(eligible_questions),
+        "completed": 0,
+        "failed": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "estimated_cost_usd": 0.0,
+    }
+    background_tasks.add_task(
+        precompute_tutoring_hints, pdf_hash, eligible_questions)
+
+
+async def precompute_tutoring_hints(pdf_hash: str, questions: List[Question]):
+    """Background stage after parsing: precompute hints for every question with bounded concurrency"""
+    hint_precompute_status[pdf_hash]["state"] = "running"
+    semaphore = asyncio.Semaphore(max(1, HINT_PRECOMPUTE_CONCURRENCY))
+
+    await asyncio.gather(
+        *(precompute_question_hint(pdf_hash, q, semaphore) for q in questions),
+        return_exceptions=True
+    )
+
+    hint_precompute_status[pdf_hash]["state"] = "done"
+    print(f"Hint precomputation finished for exam {pdf_hash}: {hint_precompute_status[pdf_hash]}")
+
+
+def lookup_precomputed_hint(request: AIRequest, model: str, session: Optional[TutoringSession]) -> Optional[str]:
+    """
+    Return a precomputed answer if the request is a default prompt for a precomputed question.
+    Only used for the first turn without student context, and only if the requested model produced it.
+    """
+    if session is not None and session.turns:
+        return None
+    if request.question_context and request.question_context.strip():
+        return None
+
+    if not request.exam_id or request.question_id is None:
+        return None
+
+    pdf_hash = exam_content_hashes.get(request.exam_id)
+    hints = tutoring_hints_storage.get(pdf_hash, {}).get(request.question_id)
+    # Parses of the same PDF may number questions differently, so the text must match too
+    if not hints or hints["model"] != model or hints["question_text"] != request.question_text:
+        return None
+
+    prompt = re.sub(r'[^\w\s]', '', request.user_question).strip().lower()
+    if prompt in DEFAULT_HINT_PROMPTS:
+        return hints["hint"]
+    if prompt in DEFAULT_EXPLAIN_PROMPTS:
+        return hints["explanation"]
+    return None
+
 # Routes
 
 
 @app.post("/api/upload", response_model=ExamPaper)
-async def upload_exam(file: UploadFile = File(...)):
+async def upload_exam(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """Upload and parse exam PDF"""
     if not file.filename.endswith('.pdf'):
         raise HTTPException(
@@ -578,29 +1175,102 @@ async def upload_exam(file: UploadFile = File(...)):
     try:
         pdf_bytes = await file.read()
         exam_paper = await parse_exam_paper_with_ai(pdf_bytes)
+
+        # Precompute tutoring hints after the response has been sent
+        if PRECOMPUTE_HINTS and exam_paper and exam_paper.exam_id:
+            schedule_hint_precompute(
+                background_tasks, exam_paper.exam_id, content_hash(pdf_bytes), exam_paper.questions)
+
         return exam_paper
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error parsing PDF: {str(e)}")
 
 
+@app.post("/api/upload-stream")
+async def upload_exam_stream(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    """Upload and parse exam PDF, streaming each question as newline-delimited JSON events"""
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(
+            status_code=400, detail="Only PDF files are allowed")
+
+    pdf_bytes = await file.read()
+
+    async def event_stream():
+        questions: List[Question] = []
+        async for event in stream_exam_paper_with_ai(pdf_bytes):
+            if event["type"] == "question":
+                questions.append(Question(**event["question"]))
+            elif event["type"] == "done" and PRECOMPUTE_HINTS:
+                # Precompute tutoring hints after the stream has finished
+                schedule_hint_precompute(
+                    background_tasks, event["exam_id"], content_hash(pdf_bytes), questions)
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+
 @app.post("/api/ask-ai")
 async def ask_ai(request: AIRequest):
     """Ask AI about a question"""
     print(
         f"Received AI request - Model: '{request.model}', Question: '{request.user_question[:50]}...'")
+    global active_ai_requests
     context = f"{request.question_text}\n{request.question_context or ''}"
 
     model = request.model.lower().strip()  # Normalize model name
 
-    if model == "openai":
-        response = await query_openai(request.user_question, context)
-    elif model == "anthropic":
-        response = await query_anthropic(request.user_question, context)
-    else:
+    if model not in ("openai", "anthropic"):
         raise HTTPException(
             status_code=400, detail=f"Invalid AI model: '{request.model}'. Must be 'Openai' or 'Anthropic'")
-    return {"response": response, "model": request.model}
+
+    session = get_tutoring_session(request)
+
+    # Answer default prompts instantly from precomputed hints
+    precomputed = lookup_precomputed_hint(request, model, session)
+    if precomputed:
+        print(
+            f"Serving precomputed hint for exam {request.exam_id} question {request.question_id}")
+        if session is not None:
+            record_session_turn(session, request.user_question, precomputed)
+        return {"response": precomputed, "model": request.model, "precomputed": True}
+
+    # Attach the question's illustration only when the student refers to it
+    image = None
+    if session is not None and IMAGE_REFERENCE_PATTERN.search(request.user_question):
+        image = question_images_storage.get(
+            request.exam_id, {}).get(request.question_id)
+
+    usage: Dict[str, int] = {}
+    active_ai_requests += 1
+    try:
+        if model == "openai":
+            response = await query_openai(request.user_question, context, usage, session, image)
+        else:
+            response = await query_anthropic(request.user_question, context, usage, session, image)
+    finally:
+        active_ai_requests -= 1
+
+    # Only successful answers become part of the conversation
+    if session is not None and usage:
+        record_session_turn(session, request.user_question,
+                            response, image_attached=image is not None)
+        print(
+            f"Tutoring session for exam {request.exam_id} question {request.question_id}: "
+            f"{len(session.turns) // 2} turn(s), ~{session_context_tokens(session)} history tokens, "
+            f"{usage['prompt_tokens']} prompt tokens used")
+
+    return {"response": response, "model": request.model, "precomputed": False}
+
+
+@app.get("/api/hint-status/{exam_id}")
+async def hint_status(exam_id: str):
+    """Get progress and token cost of tutoring hint precomputation for an exam"""
+    status = hint_precompute_status.get(exam_content_hashes.get(exam_id, ""))
+    if status is None:
+        raise HTTPException(
+            status_code=404, detail="No hint precomputation found for this exam")
+    return {"exam_id": exam_id, **status}
 
 
 @app.post("/api/submit-answer", response_model=AnswerResult)
@@ -1,6 +1,6 @@
-import React, { useState } from 'react';
-import { ExamPaper, AnswerResult, AIResponse } from './types';
-import { uploadExamPaper, submitAnswer, askAI } from './services/api';
+import React, { useRef, useState } from 'react';
+import { ExamPaper, AnswerResult, AIResponse, ExamStreamEvent } from './types';
+import { uploadExamPaperStream, submitAnswer, askAI } from './services/api';
 import UploadScreen from './components/UploadScreen';
 import ExamHeader from './components/ExamHeader';
 import ReferenceImages from './components/ReferenceImages';
@@ -18,21 +18,54 @@ const ExamApp = () => {
   const [submitting, setSubmitting] = useState<number | string | null>(null);
   const [totalScore, setTotalScore] = useState(0);
   const [totalPossible, setTotalPossible] = useState(0);
+  // Identifies this student's tutoring sessions on the backend; kept across reloads
+  const [studentId] = useState(() => {
+    const stored = localStorage.getItem('studentId');
+    if (stored) return stored;
+    const id = Math.random().toString(36).slice(2, 10);
+    localStorage.setItem('studentId', id);
+    return id;
+  });
+  // Incremented per upload so events from an abandoned stream are ignored
+  const uploadIdRef = useRef(0);
 
   const handleFileUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
     const file = e.target.files?.[0];
     if (!file) return;
 
+    const uploadId = ++uploadIdRef.current;
     setLoading(true);
+    resetState();
     try {
-      const data = await uploadExamPaper(file);
-      setExamPaper(data);
-      resetState();
+      // Render questions progressively as the backend streams them
+      await uploadExamPaperStream(file, (event: ExamStreamEvent) => {
+        if (uploadId !== uploadIdRef.current) return;
+        switch (event.type) {
+          case 'start':
+            setExamPaper({ title: 'Loading exam...', questions: [], total_points: 0, images: event.images, exam_id: event.exam_id });
+            setLoading(false);
+            break;
+          case 'title':
+            setExamPaper(prev => prev && { ...prev, title: event.title });
+            break;
+          case 'question':
+            setExamPaper(prev => prev && { ...prev, questions: [...prev.questions, event.question] });
+            break;
+          case 'done':
+            setExamPaper(prev => prev && { ...prev, title: event.title, total_points: event.total_points, answer_key: event.answer_key });
+            break;
+          case 'error':
+            throw new Error(event.message);
+        }
+      });
     } catch (error) {
       console.error('Error uploading file:', error);
+      if (uploadId !== uploadIdRef.current) return;
+      // Drop any partially streamed exam so it doesn't look usable
+      setExamPaper(null);
       alert('Error uploading file. Make sure the backend is running.');
     } finally {
-      setLoading(false);
+      if (uploadId === uploadIdRef.current) setLoading(false);
     }
   };
 
@@ -92,7 +125,10 @@ const ExamApp = () => {
         question.text,
         aiQuestion,
         model,
-        answers.get(questionId) || ''
+        answers.get(questionId) || '',
+        examPaper.exam_id,
+        questionId,
+        studentId
       );
       const newResponses = new Map(aiResponses);
       newResponses.set(questionId, { model: data.model, response: data.response });
@@ -111,6 +147,8 @@ const ExamApp = () => {
   };
 
   const handleUploadNew = () => {
+    // Abandon any exam still streaming in
+    uploadIdRef.current++;
     setExamPaper(null);
     resetState();
   };
@@ -1,18 +1,39 @@
-import { ExamPaper, AnswerResult } from '../types';
+import { AnswerResult, ExamStreamEvent } from '../types';
 
 const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://localhost:8000';
 
-export const uploadExamPaper = async (file: File): Promise<ExamPaper> => {
+export const uploadExamPaperStream = async (
+  file: File,
+  onEvent: (event: ExamStreamEvent) => void
+): Promise<void> => {
   const formData = new FormData();
   formData.append('file', file);
 
-  const response = await fetch(`${API_BASE_URL}/api/upload`, {
+  const response = await fetch(`${API_BASE_URL}/api/upload-stream`, {
     method: 'POST',
     body: formData,
   });
 
-  if (!response.ok) throw new Error('Failed to upload');
-  return response.json();
+  if (!response.ok || !response.body) throw new Error('Failed to upload');
+
+  // Events arrive as newline-delimited JSON
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    const lines = buffer.split('\n');
+    buffer = lines.pop() || '';
+    for (const line of lines) {
+      if (line.trim()) onEvent(JSON.parse(line));
+    }
+  }
+
+  if (buffer.trim()) onEvent(JSON.parse(buffer));
 };
 
 export const submitAnswer = async (
@@ -40,8 +61,11 @@ export const askAI = async (
   questionText: string,
   userQuestion: string,
   model: 'Openai' | 'Anthropic',
-  questionContext: string
-): Promise<{ response: string; model: string }> => {
+  questionContext: string,
+  examId?: string,
+  questionId?: number,
+  studentId?: string
+): Promise<{ response: string; model: string; precomputed?: boolean }> => {
   const response = await fetch(`${API_BASE_URL}/api/ask-ai`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
@@ -50,6 +74,9 @@ export const askAI = async (
       user_question: userQuestion,
       model: model,
       question_context: questionContext,
+      exam_id: examId,
+      question_id: questionId,
+      student_id: studentId,
     }),
   });
 
@@ -16,6 +16,13 @@ export interface ExamPaper {
   exam_id?: string;
 }
 
+export type ExamStreamEvent =
+  | { type: 'start'; exam_id: string; images: string[] }
+  | { type: 'title'; title: string }
+  | { type: 'question'; question: Question }
+  | { type: 'done'; exam_id: string; title: string; total_points: number; answer_key: { [key: string]: string } }
+  | { type: 'error'; message: string };
+
 export interface Answer {
   questionId: number | string;
   answer: string;